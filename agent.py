@@ -1,14 +1,74 @@
 # agent.py
-import random, csv, os, json, argparse, math
+import os, json, argparse, math, hashlib, warnings
+from collections.abc import Mapping, MutableMapping
+from types import MappingProxyType
 from datetime import datetime
 
+import numpy as np
+
+# Numeric kernels are plain Python functions registered with @kernel. Numba is only
+# imported, and the kernels compiled, once a call is long enough to pay for it (see
+# _use_jit and JIT_MIN_STEPS): a short run finishes in plain Python before Numba
+# would even have loaded. Numba is optional.
+_KERNELS = {}       # kernel name -> numba.njit options
+_jit_state = None   # None: not tried yet; True: kernels compiled; False: numba missing
+prange = range      # numba.prange once the kernels are compiled
+
+def kernel(**options):
+    """Register a numeric kernel, to be compiled with numba.njit(**options) by _use_jit()."""
+    def register(f):
+        _KERNELS[f.__name__] = options
+        return f
+    return register
+
+def _use_jit():
+    """Replace every registered kernel in this module with its Numba dispatcher.
+
+    Numba resolves the kernels' calls to each other through the module globals when
+    it compiles, so after the swap they all run compiled. Returns False if numba is
+    not installed, in which case the kernels stay plain Python (and prange = range).
+    """
+    global _jit_state, prange
+    if _jit_state is None:
+        try:
+            import numba
+        except ImportError:
+            _jit_state = False
+        else:
+            g = globals()
+            prange = numba.prange
+            for name, options in _KERNELS.items():
+                g[name] = numba.njit(**options)(g[name])
+            _jit_state = True
+    return _jit_state
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+def json_loads(data):
+    """Parse a JSON document, with orjson when installed.
+
+    orjson rejects NaN/Infinity, which json.dumps writes (the GUI saves an `inf`
+    temperature as Infinity); those documents go to the stdlib parser instead.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
 # ---------- defaults & helpers ----------
 DEFAULT_CONFIG = {
     "run": {
         "steps": 200,
         "agent_name": "Athena",
         "data_dir": "data",
-        "log_csv": True
+        "log_csv": True,
+        "seed": None,         # None -> fresh entropy each run
+        "history_dtype": "float64"  # "float32" halves history memory (step exact to 2**24)
     },
     "internal_state": {
         "pain": 0.2,
@@ -68,324 +128,1008 @@ DEFAULT_CONFIG = {
     }
 }
 
+@kernel(cache=True)
 def clamp01(x):
-    return 0.0 if x < 0.0 else 1.0 if x > 1.0 else x
-
-def homeostasis(x, target=0.3, k=0.05):
-    """Pull x toward target by fraction k each step."""
-    return x + k * (target - x)
+    # min/max rather than if/else so LLVM emits branchless minsd/maxsd
+    return min(max(x, 0.0), 1.0)
 
+@kernel(cache=True)
 def temp_stress(celsius, comfort=22.0, scale=20.0):
     """|T - comfort| mapped roughly to [0,1]."""
     return clamp01(abs(celsius - comfort) / scale)
 
 def deep_merge(base, add):
-    if not isinstance(base, dict) or not isinstance(add, dict):
+    if not isinstance(base, Mapping) or not isinstance(add, Mapping):
         return add
+    # iterative walk; only the subtrees that add touches are copied
     out = dict(base)
-    for k, v in add.items():
-        out[k] = deep_merge(base.get(k), v) if k in base else v
+    stack = [(out, add)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            cur = dst.get(k)
+            if isinstance(v, Mapping) and isinstance(cur, Mapping):
+                cur = dst[k] = dict(cur)
+                stack.append((cur, v))
+            else:
+                dst[k] = v
     return out
 
+def _frozen(d):
+    """Read-only deep copy of a nested mapping (MappingProxyType at every level)."""
+    return MappingProxyType({k: _frozen(v) if isinstance(v, Mapping) else v for k, v in d.items()})
+
+def ensure_parent_dir(filepath):
+    folder = os.path.dirname(filepath)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
 def load_config(path):
-    if not path or not os.path.exists(path):
+    if not path:
+        return DEFAULT_CONFIG
+    try:
+        with open(path, "rb") as f:
+            user_cfg = json_loads(f.read())
+    except FileNotFoundError:
         return DEFAULT_CONFIG
-    with open(path, "r", encoding="utf-8") as f:
-        user_cfg = json.load(f)
     return deep_merge(DEFAULT_CONFIG, user_cfg)
 
-# soft factors for stability
-def sat_factor(x, floor=0.1):
-    """Diminishing returns for pushes near edges: peaks at x=0.5, min near edges."""
-    return floor + (1.0 - floor) * (4.0 * x * (1.0 - x))  # in [floor,1]
-
-def edge_factor(x):
-    """High near edges, low in the middle; used to boost noise a bit near walls."""
-    return clamp01(1.0 - 4.0 * x * (1.0 - x))  # 1 at edges, 0 at center
-
+# soft factors for stability; both are affine in the same 4x(1-x) term
+@kernel(cache=True)
 def inv_u(x):
     """Inverted-U (0..1), peak at 0.5."""
     return 4.0 * x * (1.0 - x)
 
+@kernel(cache=True)
+def sat_from_u(u, floor=0.1):
+    """Diminishing returns for pushes near edges, given u = inv_u(x): in [floor, 1]."""
+    return floor + (1.0 - floor) * u
+
+@kernel(cache=True)
+def edge_from_u(u):
+    """High near edges, low in the middle, given u = inv_u(x); boosts noise near walls."""
+    return clamp01(1.0 - u)
+
+# ---------- vector layout ----------
+# internal state is held as a length-6 float64 vector in this order
+STATE_KEYS = ("pain", "instability", "need_for_control",
+              "cognitive_load", "neurochem_balance", "fatigue")
+STATE_INDEX = {k: i for i, k in enumerate(STATE_KEYS)}
+S_PAIN, S_INST, S_NFC, S_LOAD, S_NCB, S_FAT = range(6)
+# the variables are updated one after another in this order within a step; each
+# push reads the values already updated earlier in the same step
+UPDATE_ORDER = np.array([S_LOAD, S_PAIN, S_FAT, S_NCB, S_INST, S_NFC])
+
+# environment / regulation / nutrition are fixed-order float64 vectors too
+ENV_KEYS = ("temperature", "confinement", "social_contact", "noise_level", "light_level")
+REG_KEYS = ("breathing", "cognitive_override", "pharmacology", "meditation", "exercise")
+NUT_KEYS = ("glucose_level", "tryptophan", "tyrosine", "hydration", "vitamin_b12")
+ENV_INDEX = {k: i for i, k in enumerate(ENV_KEYS)}
+REG_INDEX = {k: i for i, k in enumerate(REG_KEYS)}
+NUT_INDEX = {k: i for i, k in enumerate(NUT_KEYS)}
+E_TEMP, E_CONF, E_SOCIAL, E_NOISE, E_LIGHT = range(5)
+R_BREATH, R_OVERRIDE, R_PHARM, R_MED, R_EXER = range(5)
+N_GLUC, N_TRP, N_TYR, N_HYD, N_B12 = range(5)
+
+# composite weights, laid out as ENV_KEYS / REG_KEYS / NUT_KEYS.
+# env_stress = clamp01(0.35*temp_stress + ENV_STRESS_COEF @ env + 0.20); the bias
+# and negative social weight come from social_deficit = 1 - social_contact.
+ENV_STRESS_TEMP = 0.35
+ENV_STRESS_BIAS = 0.20
+ENV_STRESS_COEF  = np.array([0.0, 0.25, -0.20, 0.20, 0.20])
+REG_RELIEF_COEF  = np.array([0.35, 0.25, 0.40, 0.30, 0.15])
+NUT_SUPPORT_COEF = np.array([0.30, 0.25, 0.20, 0.30, 0.15])
+
+# direction the agent nudges each bounded env variable (ENV_KEYS layout): down for
+# confinement/noise/light, up for social_contact; temperature (E_TEMP = 0) moves
+# toward comfort instead
+ENV_NUDGE_SIGN = np.array([0.0, -1.0, 1.0, -1.0, -1.0])
+
+# driver vector: the env-dependent drivers (which change every step) first, then the
+# reg/nut-dependent ones, which are constant over a kernel call
+DRIVER_KEYS = (("env_stress", "temp_stress") + ENV_KEYS
+               + ("reg_relief", "nut_support") + REG_KEYS + NUT_KEYS)
+DRIVER_INDEX = {k: i for i, k in enumerate(DRIVER_KEYS)}
+N_ENV_DRIVERS = 2 + len(ENV_KEYS)
+
+# one history row per step (also the CSV column order)
+HISTORY_COLUMNS = (("step",) + STATE_KEYS + ("env_stress", "reg_relief", "nut_support")
+                   + ENV_KEYS + REG_KEYS + NUT_KEYS + ("motive", "ability", "dispersion"))
+HISTORY_INDEX = {k: i for i, k in enumerate(HISTORY_COLUMNS)}
+# regulation, nutrition and their composites cannot change inside a kernel call, so
+# the kernels only record the varying columns; the static ones are kept once per segment
+VARYING_COLUMNS = (("step",) + STATE_KEYS + ("env_stress",) + ENV_KEYS
+                   + ("motive", "ability", "dispersion"))
+STATIC_COLUMNS = ("reg_relief", "nut_support") + REG_KEYS + NUT_KEYS
+VARYING_POS = np.array([HISTORY_COLUMNS.index(k) for k in VARYING_COLUMNS])
+STATIC_POS  = np.array([HISTORY_COLUMNS.index(k) for k in STATIC_COLUMNS])
+COL_STATE   = VARYING_COLUMNS.index("pain")
+COL_STRESS  = VARYING_COLUMNS.index("env_stress")
+COL_ENV     = VARYING_COLUMNS.index("temperature")
+COL_ACTION  = VARYING_COLUMNS.index("motive")
+# full precision: float64 values as repr (the shortest text that round-trips, which is
+# also what csv.DictWriter wrote), float32 history with the 9 digits it needs to round-trip
+CSV_ROW_FMT     = ",".join(["%d"] + ["%r"] * (len(HISTORY_COLUMNS) - 1)) + "\n"
+CSV_ROW_FMT_F32 = ",".join(["%d"] + ["%.9g"] * (len(HISTORY_COLUMNS) - 1)) + "\n"
+CSV_STREAM_BLOCK = 4096  # steps simulated per block when streaming to CSV
+CSV_BUFFER = 1 << 20     # bytes of file buffering for CSV output
+
+# standard normals per step: one per state variable, then one per env variable
+N_NOISE = len(STATE_KEYS) + len(ENV_KEYS)
+NOISE_POOL_ROWS = 4096
+
+# params["weights"][var][term] as a (len(STATE_KEYS), len(WEIGHT_TERMS)) matrix
+WEIGHT_TERMS = ("env", "int", "reg", "nut", "decay")
+WEIGHT_INDEX = {k: i for i, k in enumerate(WEIGHT_TERMS)}
+W_ENV, W_INT, W_REG, W_NUT, W_DECAY = range(5)
+
+# push_i = sum over terms t of weights[var][t] * (sum of coef * input).
+# Inputs are driver keys, state keys, or "bias" (a constant 1.0).
+PUSH_TERMS = {
+    "cognitive_load": {
+        "env": {"env_stress": 1.0},
+        "int": {"pain": 0.6, "instability": 0.4},
+        "reg": {"reg_relief": -1.0},
+        "nut": {"nut_support": -1.0},
+    },
+    "pain": {
+        "env": {"env_stress": 0.5, "temp_stress": 0.5},
+        "int": {"instability": 0.6, "fatigue": 0.4},
+        "reg": {"reg_relief": -0.4, "pharmacology": -0.4},
+        "nut": {"hydration": -0.6, "glucose_level": -0.4},
+    },
+    "fatigue": {
+        "env": {"env_stress": 0.3, "light_level": 0.2},
+        "int": {"cognitive_load": 0.6, "pain": 0.4},
+        "reg": {"exercise": 0.15},
+        "nut": {"glucose_level": -0.6, "hydration": -0.4},
+    },
+    "neurochem_balance": {
+        "env": {"env_stress": -1.0},
+        "int": {"cognitive_load": -0.5, "pain": -0.5},
+        "reg": {"meditation": 0.4, "exercise": 0.3},
+        "nut": {"tryptophan": 0.5, "tyrosine": 0.4, "vitamin_b12": 0.3},
+    },
+    "instability": {
+        "env": {"env_stress": 1.0, "noise_level": 0.2},
+        "int": {"cognitive_load": 0.4, "fatigue": 0.4, "pain": 0.2},
+        "reg": {"reg_relief": -1.0},
+        "nut": {"nut_support": -1.0},
+    },
+    "need_for_control": {
+        # unpredictability = 0.6*noise + 0.4*(1 - social_contact)
+        "env": {"noise_level": 0.6, "social_contact": -0.4, "bias": 0.4},
+        "int": {"instability": 0.6, "pain": 0.4},
+        "reg": {"breathing": -0.5, "meditation": -0.5},
+        "nut": {"nut_support": -0.3},
+    },
+}
+
+def weight_matrix(weights):
+    """Dict-of-dicts weights -> (len(STATE_KEYS), len(WEIGHT_TERMS)) float64 array."""
+    return np.array([[weights[var][term] for term in WEIGHT_TERMS] for var in STATE_KEYS],
+                    dtype=np.float64)
+
+def build_coupling(W):
+    """Fold the weight matrix and PUSH_TERMS into (M, C, b) so that push = M @ x + C @ s + b."""
+    M = np.zeros((len(STATE_KEYS), len(DRIVER_KEYS)))
+    C = np.zeros((len(STATE_KEYS), len(STATE_KEYS)))
+    b = np.zeros(len(STATE_KEYS))
+    for i, var in enumerate(STATE_KEYS):
+        for term, inputs in PUSH_TERMS[var].items():
+            w = W[i, WEIGHT_INDEX[term]]
+            for key, coef in inputs.items():
+                if key == "bias":
+                    b[i] += w * coef
+                elif key in STATE_INDEX:
+                    C[i, STATE_INDEX[key]] += w * coef
+                else:
+                    M[i, DRIVER_INDEX[key]] += w * coef
+    return M, C, b
+
+class VectorView(MutableMapping):
+    """Dict-like view onto a NumPy vector; reads and writes go straight to the array."""
+    __slots__ = ("_keys", "_index", "_vec")
+
+    def __init__(self, keys, index, vec):
+        self._keys = keys
+        self._index = index
+        self._vec = vec
+
+    def __getitem__(self, key): return float(self._vec[self._index[key]])
+    def __setitem__(self, key, value): self._vec[self._index[key]] = value
+    def __delitem__(self, key): raise TypeError("cannot delete fixed-layout keys")
+    def __iter__(self): return iter(self._keys)
+    def __len__(self): return len(self._keys)
+    def __repr__(self): return repr(dict(self))
+
+# ---------- numeric kernels (flat float64 arrays only) ----------
+@kernel(cache=True)
+def _dot(coef, vec):
+    acc = 0.0
+    for i in range(coef.shape[0]):
+        acc += coef[i] * vec[i]
+    return acc
+
+@kernel(cache=True)
+def _env_stress_ts(env, ts):
+    """env_stress given an already computed temp_stress ts."""
+    return clamp01(ENV_STRESS_TEMP * ts + _dot(ENV_STRESS_COEF, env) + ENV_STRESS_BIAS)
+
+@kernel(cache=True)
+def reg_relief(reg):
+    return clamp01(_dot(REG_RELIEF_COEF, reg))
+
+@kernel(cache=True)
+def nutrition_support(nut):
+    return clamp01(_dot(NUT_SUPPORT_COEF, nut))
+
+@kernel(cache=True, error_model="numpy")
+def _run_coupling(reg, nut, M, C, b, decay, dt):
+    """Per-call step coefficients: returns (M_env, C_dt, b_run, k_dt, rr, ns).
+
+    reg/nut cannot change inside a call, so their columns of M are folded into
+    the bias once; per step only the N_ENV_DRIVERS env-dependent columns remain.
+    Everything is pre-multiplied by dt (k_dt = decay * dt).
+    """
+    rr = reg_relief(reg)
+    ns = nutrition_support(nut)
+    n_reg = reg.shape[0]
+    b_run = b.copy()
+    for i in range(M.shape[0]):
+        acc = M[i, N_ENV_DRIVERS] * rr + M[i, N_ENV_DRIVERS + 1] * ns
+        for j in range(n_reg):
+            acc += M[i, N_ENV_DRIVERS + 2 + j] * reg[j]
+        for j in range(nut.shape[0]):
+            acc += M[i, N_ENV_DRIVERS + 2 + n_reg + j] * nut[j]
+        b_run[i] = dt * (b_run[i] + acc)
+    return dt * M[:, :N_ENV_DRIVERS], dt * C, b_run, dt * decay, rr, ns
+
+@kernel(cache=True, error_model="numpy")
+def _step_kernel(s, env, es, ts, M_env, C_dt, b_run, k_dt, target, noise, noise_std):
+    """Advance s in place by one step, given env_stress es and temp_stress ts of env.
+
+    M_env/C_dt/b_run/k_dt come from _run_coupling, already scaled by dt.
+    """
+    # fused per-variable update in UPDATE_ORDER: dt * push = dt * (M @ x + C @ s + b)
+    # (scaled down near the edges), then homeostatic pull + push + edge-boosted noise,
+    # clamped to [0,1]. C @ s is taken row by row from the s being updated in place,
+    # so later variables see this step's earlier updates.
+    n = s.shape[0]
+    for k in range(UPDATE_ORDER.shape[0]):
+        i = UPDATE_ORDER[k]
+        # env-dependent drivers, laid out as DRIVER_KEYS[:N_ENV_DRIVERS] = (es, ts, *env);
+        # read as scalars so the step allocates nothing
+        push = b_run[i] + M_env[i, 0] * es + M_env[i, 1] * ts
+        for j in range(env.shape[0]):
+            push += M_env[i, 2 + j] * env[j]
+        for j in range(n):
+            push += C_dt[i, j] * s[j]
+        si = s[i]
+        u = inv_u(si)  # shared by the push saturation and the noise edge boost
+        push *= sat_from_u(u)
+        std = noise_std * (0.5 + 0.5 * edge_from_u(u))
+        s[i] = clamp01(si + k_dt[i] * (target[i] - si) + push + std * noise[i])
+
+# --- agent acts on environment ---
+@kernel(cache=True)
+def motivation_ability_dispersion(s, env_stress, reg_relief, nut_support):
+    pain, inst, nfc = s[S_PAIN], s[S_INST], s[S_NFC]
+    load, ncb, fat = s[S_LOAD], s[S_NCB], s[S_FAT]
+    # motive: pain(+), need_for_control(inverted-U +), cognitive_load(+),
+    #         env_stress(+), reg_relief(-), fatigue(-), neurochem_balance(-)
+    m = (
+        0.25 * pain
+      + 0.20 * inv_u(nfc)
+      + 0.15 * load
+      + 0.20 * env_stress
+      - 0.10 * reg_relief
+      - 0.10 * fat
+      - 0.10 * ncb
+    )
+    m = clamp01(m)  # 0..1
+
+    # ability: neurochem_balance(+), nut_support(+), reg_relief(+),
+    #          fatigue(-), pain(-), cognitive_load(-), env_stress(-),
+    #          need_for_control (inverted-U + small)
+    a = (
+        0.30 * ncb
+      + 0.25 * nut_support
+      + 0.20 * reg_relief
+      - 0.20 * fat
+      - 0.15 * pain
+      - 0.10 * load
+      - 0.10 * env_stress
+      + 0.10 * inv_u(nfc)
+    )
+    a = clamp01(a)
+
+    # dispersion (range of action variability): up with instability & env_stress,
+    # down with reg_relief; small boost from need_for_control
+    disp = (
+        0.50
+      + 0.30 * inst
+      + 0.20 * env_stress
+      - 0.20 * reg_relief
+      + 0.10 * nfc
+    )
+    disp = max(0.3, min(1.7, disp))  # keep sane
+
+    return m, a, disp
+
+@kernel(cache=True)
+def update_environment(env, motive, ability, dispersion, noise, env_step, comfort_T, dispersion_noise, dt):
+    """Agent nudges environment (in place) toward lower env_stress; noise is standard normal, one per env var."""
+    act = motive * ability  # 0..1
+    if act <= 0.0:
+        return
+
+    step = env_step * act * dt
+    disp_noise = dispersion_noise * dispersion
+
+    # Move temperature toward comfort
+    dT = step * (comfort_T - env[E_TEMP]) + disp_noise * 2.0 * noise[E_TEMP]
+    env[E_TEMP] += dT  # not clamped (open-range), but drifts toward comfort
+
+    # Reduce confinement, noise, and blue/bright light; increase social_contact.
+    # One branch-free pass over the contiguous bounded vars 1..4; room is the
+    # distance to the wall being moved away from (x going down, 1 - x going up)
+    for i in range(1, env.shape[0]):
+        sg = ENV_NUDGE_SIGN[i]
+        room = 0.5 + sg * (0.5 - env[i])
+        env[i] = clamp01(env[i] + sg * step * (0.25 + 0.75 * room) + disp_noise * noise[i])
+
+@kernel(cache=True, error_model="numpy")
+def _run(s, env, reg, nut, M, C, b, decay, target, noise,
+         noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out):
+    """Run out.shape[0] full steps, writing one VARYING_COLUMNS row per step into out.
+
+    noise holds N_NOISE standard normals per step (state variables first, then env).
+    """
+    n_state, n_env = s.shape[0], env.shape[0]
+    M_env, C_dt, b_run, k_dt, rr, ns = _run_coupling(reg, nut, M, C, b, decay, dt)
+    # temp stress feeds both env_stress and the pain push; the values computed
+    # after each environment move are logged and then drive the next step
+    ts = temp_stress(env[E_TEMP], comfort_T)
+    es = _env_stress_ts(env, ts)
+    for t in range(out.shape[0]):
+        _step_kernel(s, env, es, ts, M_env, C_dt, b_run, k_dt, target, noise[t, :n_state], noise_std)
+
+        # --- agent modifies environment (CLOSE THE LOOP) ---
+        m, a, disp = motivation_ability_dispersion(s, es, rr, ns)
+        update_environment(env, m, a, disp, noise[t, n_state:], env_step, comfort_T, dispersion_noise, dt)
+
+        # log snapshot; composites are recomputed AFTER the environment move
+        ts = temp_stress(env[E_TEMP], comfort_T)
+        es = _env_stress_ts(env, ts)
+        row = out[t]
+        row[0] = step0 + t + 1
+        row[COL_STATE:COL_STATE + n_state] = s
+        row[COL_STRESS] = es
+        row[COL_ENV:COL_ENV + n_env] = env
+        row[COL_ACTION] = m
+        row[COL_ACTION + 1] = a
+        row[COL_ACTION + 2] = disp
+
+# ---------- interpreted fast path ----------
+# Without Numba, _run indexes NumPy arrays element by element, boxing a NumPy scalar on
+# every access, and calls a helper for every clamp and factor. _run_py runs the same
+# equations on Python floats, with the helpers and the fixed-length loops written out.
+# Every expression keeps _run's operation order, so the results are bit-identical; any
+# change to _step_kernel, motivation_ability_dispersion or update_environment must be
+# made here too. The conditional clamps are spelled to pick the same operand as the
+# min/max they replace, NaN included.
+SAT_FLOOR = 0.1  # sat_from_u's default floor
+_, SG_CONF, SG_SOCIAL, SG_NOISE, SG_LIGHT = ENV_NUDGE_SIGN.tolist()
+_py_coupling_cache = (None, None)  # (key, value) of the last _py_coupling call
+
+def _py_coupling(reg, nut, M, C, b, decay, target, dt):
+    """_run_coupling for _run_py, cached for repeated calls with the same arguments.
+
+    Returns ([(i, b_run, *M_env row, *C_dt row, k_dt, target) in UPDATE_ORDER], rr, ns)
+    with every value a Python float.
+    """
+    global _py_coupling_cache
+    key = (reg.tobytes(), nut.tobytes(), M.tobytes(), C.tobytes(), b.tobytes(),
+           decay.tobytes(), target.tobytes(), dt)
+    if _py_coupling_cache[0] != key:
+        M_env, C_dt, b_run, k_dt, rr, ns = _run_coupling(reg, nut, M, C, b, decay, dt)
+        rows = [(i, float(b_run[i]), *M_env[i].tolist(), *C_dt[i].tolist(),
+                 float(k_dt[i]), float(target[i])) for i in UPDATE_ORDER.tolist()]
+        _py_coupling_cache = (key, (rows, float(rr), float(ns)))
+    return _py_coupling_cache[1]
+
+def _run_py(s, env, reg, nut, M, C, b, decay, target, noise,
+            noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out):
+    """_run for interpreted calls: same arguments and results, several times faster."""
+    order, rr, ns = _py_coupling(reg, nut, M, C, b, decay, target, dt)
+    S = s.tolist()
+    e0, e1, e2, e3, e4 = env.tolist()
+    w0, w1, w2, w3, w4 = ENV_STRESS_COEF.tolist()
+    sat_slope = 1.0 - SAT_FLOOR
+
+    # temp_stress and _env_stress_ts
+    ts = abs(e0 - comfort_T) / 20.0
+    ts = 0.0 if ts < 0.0 else (1.0 if ts > 1.0 else ts)
+    es = ENV_STRESS_TEMP * ts + (0.0 + w0 * e0 + w1 * e1 + w2 * e2 + w3 * e3 + w4 * e4) + ENV_STRESS_BIAS
+    es = 0.0 if es < 0.0 else (1.0 if es > 1.0 else es)
+    hist = []
+    for t, z in zip(range(len(out)), noise.tolist()):
+        # _step_kernel
+        for i, b_i, m_es, m_ts, m0, m1, m2, m3, m4, c0, c1, c2, c3, c4, c5, k_i, tgt_i in order:
+            si = S[i]
+            push = (b_i + m_es * es + m_ts * ts + m0 * e0 + m1 * e1 + m2 * e2 + m3 * e3 + m4 * e4
+                    + c0 * S[0] + c1 * S[1] + c2 * S[2] + c3 * S[3] + c4 * S[4] + c5 * S[5])
+            u = 4.0 * si * (1.0 - si)
+            push *= SAT_FLOOR + sat_slope * u
+            edge = 1.0 - u
+            edge = 0.0 if edge < 0.0 else (1.0 if edge > 1.0 else edge)
+            x = si + k_i * (tgt_i - si) + push + noise_std * (0.5 + 0.5 * edge) * z[i]
+            S[i] = 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+
+        # motivation_ability_dispersion
+        pain, inst, nfc, load, ncb, fat = S
+        u_nfc = 4.0 * nfc * (1.0 - nfc)
+        m = (0.25 * pain + 0.20 * u_nfc + 0.15 * load + 0.20 * es
+             - 0.10 * rr - 0.10 * fat - 0.10 * ncb)
+        m = 0.0 if m < 0.0 else (1.0 if m > 1.0 else m)
+        a = (0.30 * ncb + 0.25 * ns + 0.20 * rr - 0.20 * fat - 0.15 * pain
+             - 0.10 * load - 0.10 * es + 0.10 * u_nfc)
+        a = 0.0 if a < 0.0 else (1.0 if a > 1.0 else a)
+        disp = 0.50 + 0.30 * inst + 0.20 * es - 0.20 * rr + 0.10 * nfc
+        disp = disp if disp < 1.7 else 1.7
+        disp = disp if disp > 0.3 else 0.3
+
+        # update_environment
+        act = m * a
+        if act > 0.0:
+            step = env_step * act * dt
+            dn = dispersion_noise * disp
+            e0 += step * (comfort_T - e0) + dn * 2.0 * z[6]
+            x = e1 + SG_CONF * step * (0.25 + 0.75 * (0.5 + SG_CONF * (0.5 - e1))) + dn * z[7]
+            e1 = 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+            x = e2 + SG_SOCIAL * step * (0.25 + 0.75 * (0.5 + SG_SOCIAL * (0.5 - e2))) + dn * z[8]
+            e2 = 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+            x = e3 + SG_NOISE * step * (0.25 + 0.75 * (0.5 + SG_NOISE * (0.5 - e3))) + dn * z[9]
+            e3 = 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+            x = e4 + SG_LIGHT * step * (0.25 + 0.75 * (0.5 + SG_LIGHT * (0.5 - e4))) + dn * z[10]
+            e4 = 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+
+        ts = abs(e0 - comfort_T) / 20.0
+        ts = 0.0 if ts < 0.0 else (1.0 if ts > 1.0 else ts)
+        es = ENV_STRESS_TEMP * ts + (0.0 + w0 * e0 + w1 * e1 + w2 * e2 + w3 * e3 + w4 * e4) + ENV_STRESS_BIAS
+        es = 0.0 if es < 0.0 else (1.0 if es > 1.0 else es)
+        hist.append((step0 + t + 1, *S, es, e0, e1, e2, e3, e4, m, a, disp))
+    if hist:
+        out[:len(hist)] = hist
+    s[:] = S
+    env[:] = (e0, e1, e2, e3, e4)
+
+@kernel(cache=True, parallel=True)
+def _run_batch(S, E, REG, NUT, M, C, b, decay, target, noise, scalars, dt, out):
+    """Independent _run per agent k, each with its own parameters; rows go to out[k]."""
+    for k in prange(S.shape[0]):
+        noise_std, comfort_T, env_step, dispersion_noise = scalars[k, 0], scalars[k, 1], scalars[k, 2], scalars[k, 3]
+        _run(S[k], E[k], REG[k], NUT[k], M[k], C[k], b[k], decay[k], target[k], noise[k],
+             noise_std, comfort_T, env_step, dispersion_noise, dt, 0, out[k])
+
+def source_hash():
+    """Hash of this file's source; build_kernel.py bakes it into agent_kernel."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        return int.from_bytes(hashlib.blake2b(f.read(), digest_size=7).digest(), "little")
+
+def _load_aot():
+    """Prebuilt ahead-of-time _run (see build_kernel.py), if it was built from this agent.py.
+
+    A kernel built from an older agent.py would silently run the old numerics (kernels
+    and the module constants baked into them), so it is ignored with a warning.
+    """
+    try:
+        import agent_kernel
+    except ImportError:
+        return None
+    built_from = getattr(agent_kernel, "source_hash", None)
+    if built_from is None or built_from() != source_hash():
+        warnings.warn("agent_kernel was built from a different agent.py and is ignored; "
+                      "rerun build_kernel.py", stacklevel=3)  # the importer's line
+        return None
+    return agent_kernel.run
+
+_run_aot = _load_aot()  # needs neither Numba nor warm-up
+
+# steps (summed over replicates) from which a call compiles the kernels instead of
+# running them as plain Python. _run_py costs ~5 us/step; importing Numba and loading
+# its cached kernels ~0.4 s (seconds more when agent.py changed and they recompile),
+# so compiling only pays off from ~70k steps
+JIT_MIN_STEPS = 100_000
+
+@kernel(cache=True, parallel=True)
+def _run_ensemble(S, E, reg, nut, M, C, b, decay, target, noise,
+                  noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out):
+    """Independent _run per replicate a: S[a]/E[a] are advanced in place, rows go to out[a]."""
+    for a in prange(S.shape[0]):
+        _run(S[a], E[a], reg, nut, M, C, b, decay, target, noise[a],
+             noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out[a])
+
+# ---------- optional JAX ensemble (GPU when available) ----------
+_jax_ensemble = None
+
+def _build_jax_ensemble():
+    """jit-compiled JAX version of _run_ensemble; noise is drawn on device from a PRNG key.
+
+    Same equations as _step_kernel / motivation_ability_dispersion / update_environment,
+    written over the whole (n_agents, ...) batch and scanned over steps with lax.scan.
+    """
+    import jax
+    import jax.numpy as jnp
+
+    def clamp01(x):
+        return jnp.clip(x, 0.0, 1.0)
+
+    def inv_u(x):
+        return 4.0 * x * (1.0 - x)
+
+    def stress(E, comfort_T):
+        ts = clamp01(jnp.abs(E[:, E_TEMP] - comfort_T) / 20.0)
+        return clamp01(ENV_STRESS_TEMP * ts + E @ ENV_STRESS_COEF + ENV_STRESS_BIAS), ts
+
+    def run(S, E, reg, nut, M, C, b, decay, target, key, n_steps,
+            noise_std, comfort_T, env_step, dispersion_noise, dt):
+        n_agents, n_state = S.shape
+        rr = clamp01(REG_RELIEF_COEF @ reg)
+        ns = clamp01(NUT_SUPPORT_COEF @ nut)
+        # reg/nut drivers are constant over the run: fold them into the bias (cf. _run_coupling)
+        b_run = b + M[:, N_ENV_DRIVERS:] @ jnp.concatenate((jnp.stack((rr, ns)), reg, nut))
+        M_env = M[:, :N_ENV_DRIVERS]
+
+        def step(carry, k):
+            S, E, es, ts = carry  # es/ts of E, carried over from the previous step's log
+            z = jax.random.normal(k, (n_agents, N_NOISE), dtype=S.dtype)
+            x = jnp.concatenate((es[:, None], ts[:, None], E), axis=1)
+            drive = x @ M_env.T + b_run
+            for i in UPDATE_ORDER.tolist():  # sequential, as in _step_kernel
+                si = S[:, i]
+                u = inv_u(si)
+                push = (drive[:, i] + S @ C[i]) * (0.1 + 0.9 * u)
+                std = noise_std * (0.5 + 0.5 * clamp01(1.0 - u))
+                S = S.at[:, i].set(clamp01(si + dt * decay[i] * (target[i] - si) + dt * push + std * z[:, i]))
+
+            pain, inst, nfc = S[:, S_PAIN], S[:, S_INST], S[:, S_NFC]
+            load, ncb, fat = S[:, S_LOAD], S[:, S_NCB], S[:, S_FAT]
+            m = clamp01(0.25 * pain + 0.20 * inv_u(nfc) + 0.15 * load + 0.20 * es
+                        - 0.10 * rr - 0.10 * fat - 0.10 * ncb)
+            a = clamp01(0.30 * ncb + 0.25 * ns + 0.20 * rr - 0.20 * fat - 0.15 * pain
+                        - 0.10 * load - 0.10 * es + 0.10 * inv_u(nfc))
+            disp = jnp.clip(0.50 + 0.30 * inst + 0.20 * es - 0.20 * rr + 0.10 * nfc, 0.3, 1.7)
+
+            # agent nudges its environment; agents with act <= 0 leave it untouched
+            act = m * a
+            mv = (env_step * act * dt)[:, None]
+            dn = (dispersion_noise * disp)[:, None]
+            ze = z[:, n_state:]
+            room = 0.5 + ENV_NUDGE_SIGN * (0.5 - E)
+            nudged = clamp01(E + ENV_NUDGE_SIGN * mv * (0.25 + 0.75 * room) + dn * ze)
+            temp = E + mv * (comfort_T - E) + dn * 2.0 * ze
+            moved = jnp.where(jnp.arange(E.shape[1]) == E_TEMP, temp, nudged)
+            E = jnp.where((act > 0.0)[:, None], moved, E)
+
+            es, ts = stress(E, comfort_T)
+            row = jnp.concatenate((S, es[:, None], E, m[:, None], a[:, None], disp[:, None]), axis=1)
+            return (S, E, es, ts), row
+
+        carry = (S, E) + stress(E, comfort_T)
+        (S, E, _, _), rows = jax.lax.scan(step, carry, jax.random.split(key, n_steps))
+        return S, E, rows  # rows: (n_steps, n_agents, len(VARYING_COLUMNS) - 1)
+
+    return jax.jit(run, static_argnames=("n_steps",))
+
+def expand_history(varying, static):
+    """Full HISTORY_COLUMNS rows from VARYING_COLUMNS rows and one STATIC_COLUMNS row."""
+    full = np.empty(varying.shape[:-1] + (len(HISTORY_COLUMNS),), dtype=varying.dtype)
+    full[..., VARYING_POS] = varying
+    full[..., STATIC_POS] = static
+    return full
+
+def write_csv_rows(f, rows):
+    """Write HISTORY_COLUMNS rows to f, one write per CSV_STREAM_BLOCK rows.
+
+    step is written as an integer and every other value at full precision, so the file
+    reads back to the same floats. Formats from .tolist() rows, which skips NumPy's
+    per-value scalar boxing; the blocks keep the formatted text bounded however long
+    the history is.
+    """
+    fmt = CSV_ROW_FMT_F32 if rows.dtype == np.float32 else CSV_ROW_FMT
+    for i in range(0, len(rows), CSV_STREAM_BLOCK):
+        block = rows[i:i + CSV_STREAM_BLOCK].tolist()
+        f.write("".join([fmt % row for row in map(tuple, block)]))
+
 # ---------- Agent ----------
 class Agent:
+    __slots__ = ("name", "step", "_params",
+                 "_s", "_env", "_reg", "_nut", "_initial",
+                 "_W", "_M", "_C", "_b", "_decay", "_target",
+                 "_noise_std", "_comfort_T", "_env_step", "_disp_noise",
+                 "_rng", "_noise_pool", "_noise_pos",
+                 "_history_buf", "_segments", "_n", "_keep_history", "_csv", "_csv_rows",
+                 "_csv_keep_prev")
+
     def __init__(self, config):
         run = config.get("run", {})
         self.name = run.get("agent_name", "Agent")
-        self.internal_state = dict(config["internal_state"])
-        self.environment   = dict(config["environment"])
-        self.regulation    = dict(config["regulation"])
-        self.nutrition     = dict(config["nutrition"])
-        self.params        = dict(config["params"])
-        self.targets       = dict(self.params.get("targets", {}))
-        self.envp          = dict(self.params.get("env_update", {}))
-
-        self.history = []
+        self._s   = np.array([config["internal_state"][k] for k in STATE_KEYS], dtype=np.float64)
+        self._env = np.array([config["environment"][k] for k in ENV_KEYS], dtype=np.float64)
+        self._reg = np.array([config["regulation"][k] for k in REG_KEYS], dtype=np.float64)
+        self._nut = np.array([config["nutrition"][k] for k in NUT_KEYS], dtype=np.float64)
+        self._initial = (self._s.copy(), self._env.copy(), self._reg.copy(), self._nut.copy())
+        self.params = config["params"]  # compiles the kernel inputs
+        self._rng = np.random.default_rng(run.get("seed"))
+        self._noise_pool = np.empty((NOISE_POOL_ROWS, N_NOISE))
+        self._noise_pos = NOISE_POOL_ROWS  # empty: first draw fills the pool
+
+        # varying columns live in a preallocated (capacity, len(VARYING_COLUMNS)) buffer;
+        # _segments holds (first_row, STATIC_COLUMNS row) each time reg/nut change
+        self._history_buf = np.empty((0, len(VARYING_COLUMNS)), dtype=run.get("history_dtype", "float64"))
+        self._segments = []
+        self._n = 0
+        self._keep_history = True
+        self._csv = None        # open file while streaming rows (see open_csv)
+        self._csv_rows = 0
         self.step = 0
 
     def __str__(self): return f"<Agent {self.name}>"
 
-    # --- composites ---
-    def _env_stress(self):
-        e = self.environment
-        social_deficit = 1.0 - e["social_contact"]
-        return clamp01(
-            0.35 * temp_stress(e["temperature"], self.envp.get("comfort_temperature", 22.0)) +
-            0.25 * e["confinement"] +
-            0.20 * e["noise_level"] +
-            0.20 * e["light_level"] +
-            0.20 * social_deficit
-        )
+    @classmethod
+    def from_overrides(cls, **sections):
+        """Agent from DEFAULT_CONFIG with per-section overrides, no config file involved.
+
+        e.g. Agent.from_overrides(run={"seed": 1}, params={"noise_std": 0.0})
+        """
+        return cls(deep_merge(DEFAULT_CONFIG, sections))
+
+    def reset(self):
+        """Back to the constructed state/environment/regulation/nutrition, with empty history.
+
+        Reuses the agent (and its buffers) between sweep replicates; the generator is not reseeded.
+        """
+        for vec, initial in zip((self._s, self._env, self._reg, self._nut), self._initial):
+            vec[:] = initial
+        self._segments = []
+        self._n = 0
+        self.step = 0
+
+    @property
+    def params(self):
+        """The parameters, read-only; the kernels run on a compiled copy of them.
+
+        To change them assign a new mapping, which is recompiled and used from the
+        next step on, e.g. agent.params = deep_merge(agent.params, {"noise_std": 0.0}).
+        """
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        self._params = _frozen(params)
+        self._compile_params()
+
+    @property
+    def targets(self):
+        """params["targets"] (read-only)."""
+        return self._params.get("targets", MappingProxyType({}))
+
+    @property
+    def envp(self):
+        """params["env_update"] (read-only)."""
+        return self._params.get("env_update", MappingProxyType({}))
+
+    def _compile_params(self):
+        """Flatten self.params into the arrays and floats the kernels take (see the params setter)."""
+        # constant coupling: push = M @ drivers + C @ s + b
+        self._W = weight_matrix(self.params["weights"])
+        self._M, self._C, self._b = build_coupling(self._W)
+        self._decay  = self._W[:, W_DECAY].copy()
+        self._noise_std = float(self.params["noise_std"])
+        targets, envp = self.targets, self.envp
+        self._target = np.array([targets.get(k, 0.3) for k in STATE_KEYS])
+        self._comfort_T  = float(envp.get("comfort_temperature", 22.0))
+        self._env_step   = float(envp.get("env_step", 0.05))
+        self._disp_noise = float(envp.get("dispersion_noise", 0.02))
+
+    @property
+    def internal_state(self):
+        return VectorView(STATE_KEYS, STATE_INDEX, self._s)
+
+    @internal_state.setter
+    def internal_state(self, values):
+        self._s[:] = [values[k] for k in STATE_KEYS]
+
+    @property
+    def environment(self):
+        return VectorView(ENV_KEYS, ENV_INDEX, self._env)
+
+    @environment.setter
+    def environment(self, values):
+        self._env[:] = [values[k] for k in ENV_KEYS]
+
+    @property
+    def regulation(self):
+        return VectorView(REG_KEYS, REG_INDEX, self._reg)
+
+    @regulation.setter
+    def regulation(self, values):
+        self._reg[:] = [values[k] for k in REG_KEYS]
+
+    @property
+    def nutrition(self):
+        return VectorView(NUT_KEYS, NUT_INDEX, self._nut)
 
+    @nutrition.setter
+    def nutrition(self, values):
+        self._nut[:] = [values[k] for k in NUT_KEYS]
+
+    @property
+    def keep_history(self):
+        """Whether simulated rows are retained; when False they are scratch space reused by the next call."""
+        return self._keep_history
+
+    @keep_history.setter
+    def keep_history(self, value):
+        self._keep_history = bool(value)
+
+    @property
+    def history_array(self):
+        """Recorded rows as a (steps, len(HISTORY_COLUMNS)) array, one column per HISTORY_COLUMNS entry.
+
+        Assembled on each access from the varying buffer and the static segments.
+        """
+        full = expand_history(self._history_buf[:self._n], 0.0)
+        bounds = [start for start, _ in self._segments[1:]] + [self._n]
+        for (start, static), stop in zip(self._segments, bounds):
+            full[start:stop, STATIC_POS] = static
+        return full
+
+    @property
+    def history(self):
+        """Recorded rows as a list of dicts (built on demand from history_array)."""
+        rows = []
+        for values in self.history_array.tolist():
+            row = dict(zip(HISTORY_COLUMNS, values))
+            row["step"] = int(row["step"])
+            rows.append(row)
+        return rows
+
+    def reserve_history(self, steps):
+        """Preallocate room for `steps` more history rows, e.g. when the run length is known."""
+        if self._n + steps > self._history_buf.shape[0]:
+            self._grow(self._n + steps)
+
+    def _reserve(self, n):
+        """Make room for n more history rows, doubling capacity when full."""
+        need = self._n + n
+        if need > self._history_buf.shape[0]:
+            self._grow(max(need, 2 * self._history_buf.shape[0]))
+
+    def _grow(self, capacity):
+        grown = np.empty((capacity, len(VARYING_COLUMNS)), dtype=self._history_buf.dtype)
+        grown[:self._n] = self._history_buf[:self._n]
+        self._history_buf = grown
+
+    def _noiseless(self):
+        """True for a deterministic config, whose noise draws would all be multiplied by 0."""
+        return self._noise_std == 0.0 and self._disp_noise == 0.0
+
+    def _draw_noise(self, n):
+        """(n, N_NOISE) standard normals; short requests are served from a pre-drawn pool."""
+        if self._noiseless():
+            return np.zeros((n, N_NOISE))
+        if n > NOISE_POOL_ROWS:
+            return self._rng.standard_normal((n, N_NOISE))
+        if self._noise_pos + n > NOISE_POOL_ROWS:
+            self._rng.standard_normal(out=self._noise_pool)  # refill in place, no new buffer
+            self._noise_pos = 0
+        noise = self._noise_pool[self._noise_pos:self._noise_pos + n]
+        self._noise_pos += n
+        return noise
+
+    def _static_row(self):
+        """Current STATIC_COLUMNS values, or the last recorded row if reg/nut are unchanged."""
+        if self._segments:
+            static = self._segments[-1][1]
+            # byte comparison: a few hundred ns, against microseconds for np.array_equal
+            if static[2:].tobytes() == self._reg.tobytes() + self._nut.tobytes():
+                return static
+        return np.concatenate(([self._reg_relief(), self._nutrition_support()],
+                               self._reg, self._nut))
+
+    # --- composites ---
+    # plain NumPy rather than the kernels: called from Python once per simulate_n_steps,
+    # where dispatching into (or compiling) a kernel would cost more than the dot product
     def _reg_relief(self):
-        r = self.regulation
-        return clamp01(
-            0.35 * r["breathing"] +
-            0.30 * r["meditation"] +
-            0.25 * r["cognitive_override"] +
-            0.15 * r["exercise"] +
-            0.40 * r["pharmacology"]
-        )
+        return min(max(float(REG_RELIEF_COEF @ self._reg), 0.0), 1.0)
 
     def _nutrition_support(self):
-        n = self.nutrition
-        return clamp01(
-            0.30 * n["glucose_level"] +
-            0.30 * n["hydration"] +
-            0.25 * n["tryptophan"] +
-            0.20 * n["tyrosine"] +
-            0.15 * n["vitamin_b12"]
-        )
-
-    def _noise_for(self, x):
-        std = self.params["noise_std"] * (0.5 + 0.5 * edge_factor(x))
-        return random.gauss(0.0, std)
-
-    # --- agent acts on environment ---
-    def _motivation_ability_dispersion(self, env_stress, reg_relief, nut_support):
-        s = self.internal_state
-        # motive: pain(+), need_for_control(inverted-U +), cognitive_load(+),
-        #         env_stress(+), reg_relief(-), fatigue(-), neurochem_balance(-)
-        m = (
-            0.25 * s["pain"]
-          + 0.20 * inv_u(s["need_for_control"])
-          + 0.15 * s["cognitive_load"]
-          + 0.20 * env_stress
-          - 0.10 * reg_relief
-          - 0.10 * s["fatigue"]
-          - 0.10 * s["neurochem_balance"]
-        )
-        m = clamp01(m)  # 0..1
-
-        # ability: neurochem_balance(+), nut_support(+), reg_relief(+),
-        #          fatigue(-), pain(-), cognitive_load(-), env_stress(-),
-        #          need_for_control (inverted-U + small)
-        a = (
-            0.30 * s["neurochem_balance"]
-          + 0.25 * nut_support
-          + 0.20 * reg_relief
-          - 0.20 * s["fatigue"]
-          - 0.15 * s["pain"]
-          - 0.10 * s["cognitive_load"]
-          - 0.10 * env_stress
-          + 0.10 * inv_u(s["need_for_control"])
-        )
-        a = clamp01(a)
-
-        # dispersion (range of action variability): up with instability & env_stress,
-        # down with reg_relief; small boost from need_for_control
-        disp = (
-            0.50
-          + 0.30 * s["instability"]
-          + 0.20 * env_stress
-          - 0.20 * reg_relief
-          + 0.10 * s["need_for_control"]
-        )
-        disp = max(0.3, min(1.7, disp))  # keep sane
-
-        return m, a, disp
-
-    def _update_environment(self, motive, ability, dispersion, dt):
-        """Agent nudges environment toward lower env_stress."""
-        act = motive * ability  # 0..1
-        if act <= 0.0:
-            return
+        return min(max(float(NUT_SUPPORT_COEF @ self._nut), 0.0), 1.0)
 
-        step = self.envp.get("env_step", 0.05) * act * dt
-        comfort_T = self.envp.get("comfort_temperature", 22.0)
-        disp_noise = self.envp.get("dispersion_noise", 0.02) * dispersion
+    # --- simulate ---
+    def simulate_step(self, dt=1.0):
+        self.simulate_n_steps(1, dt)
 
-        e = self.environment
+    def simulate_n_steps(self, n, dt=1.0):
+        """Run n steps in a single kernel call; returns the (n, len(VARYING_COLUMNS)) rows.
 
-        # Move temperature toward comfort
-        dT = step * (comfort_T - e["temperature"]) + random.gauss(0.0, disp_noise * 2.0)
-        e["temperature"] += dT  # not clamped (open-range), but drifts toward comfort
+        If a CSV stream is open the full rows are written to it straight away; without
+        keep_history the returned rows are scratch space reused by the next call.
+        """
+        self._reserve(n)
+        # bind attributes once; with n == 1 this wrapper is the whole per-step cost
+        i0, step, csv = self._n, self.step, self._csv
+        out = self._history_buf[i0:i0 + n]
+        static = self._static_row()
+        args = (self._s, self._env, self._reg, self._nut,
+                self._M, self._C, self._b, self._decay, self._target, self._draw_noise(n),
+                *self._scalars())
+        self._kernel(n)(*args, float(dt), step, out)
+        self.step = step + n
+        if csv is not None:
+            write_csv_rows(csv, expand_history(out, static))
+            self._csv_rows += n
+        if self._keep_history:
+            if not self._segments or self._segments[-1][1] is not static:
+                self._segments.append((i0, static))
+            self._n = i0 + n
+        return out
 
-        # Reduce confinement, noise, and blue/bright light; increase social_contact
-        def nudgedown(x): 
-            dx = -step * (0.25 + 0.75 * x) + random.gauss(0.0, disp_noise)
-            return clamp01(x + dx)
+    def run(self, n_steps, dt=1.0):
+        """Simulate n_steps in as few kernel calls as possible.
 
-        def nudgeup(x): 
-            dx = step * (0.25 + 0.75 * (1.0 - x)) + random.gauss(0.0, disp_noise)
-            return clamp01(x + dx)
+        While a CSV stream is open or history is off the run goes in CSV_STREAM_BLOCK-step
+        calls so the scratch rows stay bounded; otherwise it is a single call into
+        preallocated history.
+        """
+        if self._keep_history:
+            self.reserve_history(n_steps)
+        self._kernel(n_steps)  # decide on JIT for the whole run; the blocks may be shorter
+        streaming = self._csv is not None or not self._keep_history
+        block = CSV_STREAM_BLOCK if streaming else max(n_steps, 1)
+        for done in range(0, n_steps, block):
+            self.simulate_n_steps(min(block, n_steps - done), dt)
 
-        e["confinement"]   = nudgedown(e["confinement"])
-        e["noise_level"]   = nudgedown(e["noise_level"])
-        e["light_level"]   = nudgedown(e["light_level"])
-        e["social_contact"]= nudgeup(e["social_contact"])
+    def _kernel(self, n):
+        """The _run for an n-step call: the prebuilt AOT one if usable, else the JIT-compiled
+        one when n >= JIT_MIN_STEPS (or the kernels are compiled already), else _run_py."""
+        if _run_aot is not None and self._history_buf.dtype == np.float64:  # AOT takes float64 rows only
+            return _run_aot
+        if n >= JIT_MIN_STEPS:
+            _use_jit()
+        return _run if _jit_state else _run_py
 
-    # --- simulate one step ---
-    def simulate_step(self, dt=1.0):
-        w = self.params["weights"]
-        s = self.internal_state
-
-        env = self._env_stress()
-        reg = self._reg_relief()
-        nut = self._nutrition_support()
-
-        # helpers with per-variable targets
-        def pull(x, k, var):
-            target = self.targets.get(var, 0.3)
-            return homeostasis(x, target=target, k=k * dt)
-
-        # 1) Cognitive Load (bad -> push scales down near edges)
-        w_key = w["cognitive_load"]
-        load_push = (w_key["env"] * env +
-                     w_key["int"] * (0.6 * s["pain"] + 0.4 * s["instability"]) -
-                     w_key["reg"] * reg -
-                     w_key["nut"] * nut)
-        load_push *= sat_factor(s["cognitive_load"])
-        s["cognitive_load"] = clamp01(
-            pull(s["cognitive_load"], w_key["decay"], "cognitive_load")
-            + dt * load_push
-            + self._noise_for(s["cognitive_load"])
-        )
-
-        # 2) Pain (bad)
-        w_key = w["pain"]
-        pain_push = (w_key["env"] * (0.5 * env + 0.5 * temp_stress(self.environment["temperature"], self.envp.get("comfort_temperature",22.0))) +
-                     w_key["int"] * (0.6 * s["instability"] + 0.4 * s["fatigue"]) -
-                     w_key["reg"] * (0.4 * reg + 0.4 * self.regulation["pharmacology"]) -
-                     w_key["nut"] * (0.6 * self.nutrition["hydration"] + 0.4 * self.nutrition["glucose_level"]))
-        pain_push *= sat_factor(s["pain"])
-        s["pain"] = clamp01(
-            pull(s["pain"], w_key["decay"], "pain")
-            + dt * pain_push
-            + self._noise_for(s["pain"])
-        )
-
-        # 3) Fatigue (bad)
-        w_key = w["fatigue"]
-        fatigue_push = (w_key["env"] * (0.3 * env + 0.2 * self.environment["light_level"]) +
-                        w_key["int"] * (0.6 * s["cognitive_load"] + 0.4 * s["pain"]) +
-                        w_key["reg"] * (0.3 * self.regulation["exercise"]) * 0.5
-                        - w_key["nut"] * (0.6 * self.nutrition["glucose_level"] + 0.4 * self.nutrition["hydration"]))
-        fatigue_push *= sat_factor(s["fatigue"])
-        s["fatigue"] = clamp01(
-            pull(s["fatigue"], w_key["decay"], "fatigue")
-            + dt * fatigue_push
-            + self._noise_for(s["fatigue"])
-        )
-
-        # 4) Neurochem Balance (good)
-        w_key = w["neurochem_balance"]
-        ncb_push = (- w_key["env"] * env
-                    - w_key["int"] * (0.5 * s["cognitive_load"] + 0.5 * s["pain"])
-                    + w_key["reg"] * (0.4 * self.regulation["meditation"] + 0.3 * self.regulation["exercise"])
-                    + w_key["nut"] * (0.5 * self.nutrition["tryptophan"] + 0.4 * self.nutrition["tyrosine"] + 0.3 * self.nutrition["vitamin_b12"]))
-        ncb_push *= sat_factor(s["neurochem_balance"])
-        s["neurochem_balance"] = clamp01(
-            pull(s["neurochem_balance"], w_key["decay"], "neurochem_balance")
-            + dt * ncb_push
-            + self._noise_for(s["neurochem_balance"])
-        )
-
-        # 5) Instability (bad)
-        w_key = w["instability"]
-        inst_push = (w_key["env"] * (env + 0.2 * self.environment["noise_level"]) +
-                     w_key["int"] * (0.4 * s["cognitive_load"] + 0.4 * s["fatigue"] + 0.2 * s["pain"]) -
-                     w_key["reg"] * reg -
-                     w_key["nut"] * nut)
-        inst_push *= sat_factor(s["instability"])
-        s["instability"] = clamp01(
-            pull(s["instability"], w_key["decay"], "instability")
-            + dt * inst_push
-            + self._noise_for(s["instability"])
-        )
-
-        # 6) Need for Control (bad-ish; inverted-U influences handled in env action)
-        w_key = w["need_for_control"]
-        unpredictability = clamp01(0.6 * self.environment["noise_level"] + 0.4 * (1.0 - self.environment["social_contact"]))
-        nfc_push = (w_key["env"] * unpredictability +
-                    w_key["int"] * (0.6 * s["instability"] + 0.4 * s["pain"]) -
-                    w_key["reg"] * (0.5 * self.regulation["breathing"] + 0.5 * self.regulation["meditation"]) -
-                    w_key["nut"] * (0.3 * nut))
-        nfc_push *= sat_factor(s["need_for_control"])
-        s["need_for_control"] = clamp01(
-            pull(s["need_for_control"], w_key["decay"], "need_for_control")
-            + dt * nfc_push
-            + self._noise_for(s["need_for_control"])
-        )
+    def simulate_ensemble(self, n_agents, n_steps, dt=1.0):
+        """Run n_agents independent replicates for n_steps each, in parallel across cores.
 
-        # --- agent modifies environment (CLOSE THE LOOP) ---
-        motive, ability, disp = self._motivation_ability_dispersion(env, reg, nut)
-        self._update_environment(motive, ability, disp, dt)
-
-        # recompute composites AFTER environment move (for logging)
-        env2 = self._env_stress()
-        reg2 = self._reg_relief()
-        nut2 = self._nutrition_support()
-
-        # log snapshot
-        self.step += 1
-        self.history.append({
-            "step": self.step,
-            "pain": s["pain"],
-            "instability": s["instability"],
-            "need_for_control": s["need_for_control"],
-            "cognitive_load": s["cognitive_load"],
-            "neurochem_balance": s["neurochem_balance"],
-            "fatigue": s["fatigue"],
-            # composites (post-env-update)
-            "env_stress": env2,
-            "reg_relief": reg2,
-            "nut_support": nut2,
-            # raw env/reg/nut
-            "temperature": self.environment["temperature"],
-            "confinement": self.environment["confinement"],
-            "social_contact": self.environment["social_contact"],
-            "noise_level": self.environment["noise_level"],
-            "light_level": self.environment["light_level"],
-            "breathing": self.regulation["breathing"],
-            "cognitive_override": self.regulation["cognitive_override"],
-            "pharmacology": self.regulation["pharmacology"],
-            "meditation": self.regulation["meditation"],
-            "exercise": self.regulation["exercise"],
-            "glucose_level": self.nutrition["glucose_level"],
-            "tryptophan": self.nutrition["tryptophan"],
-            "tyrosine": self.nutrition["tyrosine"],
-            "hydration": self.nutrition["hydration"],
-            "vitamin_b12": self.nutrition["vitamin_b12"],
-            # action diagnostics
-            "motive": motive,
-            "ability": ability,
-            "dispersion": disp
-        })
+        Every replicate starts from this agent's current state and environment and
+        gets its own noise; the agent itself is not advanced. Returns an
+        (n_agents, n_steps, len(HISTORY_COLUMNS)) array of history rows.
+        """
+        S = np.tile(self._s, (n_agents, 1))
+        E = np.tile(self._env, (n_agents, 1))
+        if self._noiseless():
+            noise = np.zeros((n_agents, n_steps, N_NOISE))
+        else:
+            noise = self._rng.standard_normal((n_agents, n_steps, N_NOISE))
+        out = np.empty((n_agents, n_steps, len(VARYING_COLUMNS)))
+        args = (self._reg, self._nut, self._M, self._C, self._b, self._decay, self._target)
+        if n_agents * n_steps >= JIT_MIN_STEPS:
+            _use_jit()
+        if _jit_state:
+            _run_ensemble(S, E, *args, noise, *self._scalars(), float(dt), self.step, out)
+        else:
+            for k in range(n_agents):
+                _run_py(S[k], E[k], *args, noise[k], *self._scalars(), float(dt), self.step, out[k])
+        return expand_history(out, self._static_row())
+
+    def simulate_ensemble_gpu(self, n_agents, n_steps, dt=1.0):
+        """simulate_ensemble on JAX's default device (a GPU when one is available).
+
+        The whole trajectory stays on device inside one lax.scan and the noise comes
+        from a JAX PRNG key seeded from this agent's generator, so results match the
+        CPU path in distribution, not draw for draw. Runs in JAX's default precision
+        (float32 unless jax_enable_x64 is set). Requires jax.
+        """
+        global _jax_ensemble
+        if _jax_ensemble is None:
+            try:
+                _jax_ensemble = _build_jax_ensemble()
+            except ImportError as e:
+                raise ImportError(f"simulate_ensemble_gpu needs jax: {e}") from e
+        import jax
+        key = jax.random.PRNGKey(int(self._rng.integers(2**31)))
+        _, _, rows = _jax_ensemble(np.tile(self._s, (n_agents, 1)), np.tile(self._env, (n_agents, 1)),
+                                   self._reg, self._nut, self._M, self._C, self._b,
+                                   self._decay, self._target, key, n_steps,
+                                   *self._scalars(), float(dt))
+        out = np.empty((n_agents, n_steps, len(VARYING_COLUMNS)))
+        out[..., 0] = self.step + np.arange(1, n_steps + 1)
+        out[..., 1:] = np.asarray(rows).transpose(1, 0, 2)
+        return expand_history(out, self._static_row())
+
+    def _scalars(self):
+        """(noise_std, comfort_T, env_step, dispersion_noise) as floats for the kernels."""
+        return self._noise_std, self._comfort_T, self._env_step, self._disp_noise
 
     def save_history_csv(self, filepath):
-        if not self.history:
+        if not self._n:
             print("No history to save.")
             return
-        folder = os.path.dirname(filepath)
-        if folder and not os.path.exists(folder):
-            os.makedirs(folder, exist_ok=True)
-        fieldnames = list(self.history[0].keys())
-        with open(filepath, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(self.history)
-        print(f"Saved {len(self.history)} rows to {filepath}")
+        ensure_parent_dir(filepath)
+        with open(filepath, "w", newline="", encoding="utf-8", buffering=CSV_BUFFER) as f:
+            f.write(",".join(HISTORY_COLUMNS) + "\n")
+            write_csv_rows(f, self.history_array)
+        print(f"Saved {self._n} rows to {filepath}")
+
+    # --- streaming CSV ---
+    def open_csv(self, filepath, keep_history=True):
+        """Write the CSV header now and stream every simulated row to filepath.
+
+        With keep_history=False rows are not retained in memory, so memory use
+        stays flat however long the run is.
+        """
+        self.close_csv()
+        ensure_parent_dir(filepath)
+        self._csv = open(filepath, "w", newline="", encoding="utf-8", buffering=CSV_BUFFER)
+        self._csv.write(",".join(HISTORY_COLUMNS) + "\n")
+        self._csv_rows = 0
+        self._csv_keep_prev = self._keep_history  # restored by close_csv
+        self._keep_history = keep_history
+
+    def close_csv(self, discard=False):
+        """Finish the stream opened by open_csv.
+
+        A stream that received no rows, or one closed with discard=True (e.g. after
+        a failed run), is deleted rather than left as a header-only or partial file.
+        """
+        if self._csv is None:
+            return
+        path = self._csv.name
+        self._csv.close()
+        self._csv = None
+        self._keep_history = self._csv_keep_prev
+        if discard or not self._csv_rows:
+            os.remove(path)
+            if not discard:
+                print("No history to save.")
+            return
+        print(f"Saved {self._csv_rows} rows to {path}")
+
+def run_batch(configs, n_steps, dt=1.0):
+    """Simulate a fresh Agent per config for n_steps, in parallel across cores (parameter sweeps).
+
+    Each agent draws its noise from its own generator (run.seed), so a batch entry
+    matches Agent(cfg).simulate_n_steps(n_steps). Returns a
+    (len(configs), n_steps, len(HISTORY_COLUMNS)) array of history rows.
+    """
+    agents = [Agent(cfg) for cfg in configs]
+    S    = np.stack([a._s for a in agents])
+    E    = np.stack([a._env for a in agents])
+    REG  = np.stack([a._reg for a in agents])
+    NUT  = np.stack([a._nut for a in agents])
+    M    = np.stack([a._M for a in agents])
+    C    = np.stack([a._C for a in agents])
+    b    = np.stack([a._b for a in agents])
+    decay  = np.stack([a._decay for a in agents])
+    target = np.stack([a._target for a in agents])
+    noise  = np.stack([np.zeros((n_steps, N_NOISE)) if a._noiseless()
+                       else a._rng.standard_normal((n_steps, N_NOISE)) for a in agents])
+    scalars = np.array([a._scalars() for a in agents])
+    out = np.empty((len(agents), n_steps, len(VARYING_COLUMNS)))
+    if len(agents) * n_steps >= JIT_MIN_STEPS:
+        _use_jit()
+    if _jit_state:
+        _run_batch(S, E, REG, NUT, M, C, b, decay, target, noise, scalars, float(dt), out)
+    else:
+        for k, a in enumerate(agents):
+            _run_py(S[k], E[k], REG[k], NUT[k], M[k], C[k], b[k], decay[k], target[k], noise[k],
+                    *a._scalars(), float(dt), 0, out[k])
+    static = np.stack([a._static_row() for a in agents])
+    return expand_history(out, static[:, None, :])
 
 # ---------- CLI ----------
 def parse_args():
@@ -404,17 +1148,21 @@ def maybe_plot(agent, show_composites=True):
     except Exception as e:
         print(f"[plot] matplotlib not available: {e}")
         return
-    if not agent.history:
+    hist = agent.history_array
+    if not len(hist):
         print("[plot] no history to plot")
         return
-    steps = [row["step"] for row in agent.history]
-    internal_vars = ["pain","instability","need_for_control","cognitive_load","neurochem_balance","fatigue"]
+    steps = hist[:, 0]
+    plt.rcParams["path.simplify_threshold"] = 1.0  # long traces: merge sub-pixel segments
     plt.figure(figsize=(10,6))
-    for var in internal_vars:
-        plt.plot(steps, [row[var] for row in agent.history], label=var)
+    # one plot call per group; matplotlib draws each column of the 2-D slice as a line
+    groups = [(STATE_KEYS, "-")]
     if show_composites:
-        for var in ["env_stress","reg_relief","nut_support"]:
-            plt.plot(steps, [row[var] for row in agent.history], linestyle="--", label=var)
+        groups.append((("env_stress","reg_relief","nut_support"), "--"))
+    for names, style in groups:
+        lines = plt.plot(steps, hist[:, [HISTORY_INDEX[k] for k in names]], linestyle=style)
+        for line, name in zip(lines, names):
+            line.set_label(name)
     plt.ylim(0,1); plt.xlabel("Step"); plt.ylabel("Value (0–1)")
     plt.title(f"Agent Simulation: {agent.name}")
     plt.legend(fontsize="small"); plt.grid(True, alpha=0.3); plt.tight_layout()
@@ -424,30 +1172,34 @@ if __name__ == "__main__":
     args = parse_args()
     cfg = load_config(args.config)
 
-    # CLI overrides for GUI convenience
-    if args.steps is not None:
-        cfg.setdefault("run", {})["steps"] = args.steps
-    if args.name is not None:
-        cfg.setdefault("run", {})["agent_name"] = args.name
-    if args.outdir is not None:
-        cfg.setdefault("run", {})["data_dir"] = args.outdir
+    # CLI overrides for GUI convenience; merged into a copy, since without a config
+    # file cfg is DEFAULT_CONFIG itself
+    overrides = {"steps": args.steps, "agent_name": args.name, "data_dir": args.outdir}
+    cfg = deep_merge(cfg, {"run": {k: v for k, v in overrides.items() if v is not None}})
 
     agent = Agent(cfg)
     print(agent)
 
-    steps = cfg["run"]["steps"]
-    for _ in range(steps):
-        agent.simulate_step(dt=1.0)
+    # stream rows to CSV as they are produced; keep them in memory only for plotting
+    if cfg["run"].get("log_csv", True):
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_dir = cfg["run"]["data_dir"]
+        out_path = os.path.join(out_dir, f"{agent.name.lower()}_run_{ts}.csv")
+        agent.open_csv(out_path, keep_history=args.plot)
+    else:
+        agent.keep_history = args.plot  # nobody reads the rows; only the final state is printed
+
+    try:
+        agent.run(cfg["run"]["steps"], dt=1.0)
+    except BaseException:
+        agent.close_csv(discard=True)  # no partial CSV, and the handle is released
+        raise
 
     print("Final Internal State:")
     for k, v in agent.internal_state.items():
         print(f"  {k:18s} {v:.3f}")
 
-    if cfg["run"].get("log_csv", True):
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_dir = cfg["run"]["data_dir"]
-        out_path = os.path.join(out_dir, f"{agent.name.lower()}_run_{ts}.csv")
-        agent.save_history_csv(out_path)
+    agent.close_csv()
 
     if args.plot:
         maybe_plot(agent, show_composites=True)
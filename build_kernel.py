@@ -0,0 +1,42 @@
+# build_kernel.py
+"""Ahead-of-time compile the simulation kernel into the agent_kernel extension.
+
+    python build_kernel.py
+
+writes agent_kernel.*.so / .pyd next to agent.py. agent.py uses it when present and
+built from the current agent.py (checked via source_hash), so it neither imports Numba
+nor compiles anything. After any edit to agent.py the extension is ignored until rebuilt.
+"""
+import os
+
+from numba.pycc import CC
+
+import agent
+
+agent._use_jit()  # pycc compiles agent._run through the Numba dispatchers
+
+cc = CC("agent_kernel")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+cc.verbose = True
+
+# same arguments as agent._run; all arrays are C-contiguous float64
+_ARRAYS  = ("f8[::1], f8[::1], f8[::1], f8[::1],"   # s, env, reg, nut
+            " f8[:, ::1], f8[:, ::1], f8[::1],"     # M, C, b
+            " f8[::1], f8[::1], f8[:, ::1]")        # decay, target, noise
+_SCALARS = "f8, f8, f8, f8"                         # noise_std, comfort_T, env_step, dispersion_noise
+RUN_SIGNATURE = f"void({_ARRAYS}, {_SCALARS}, f8, i8, f8[:, ::1])"   # ... dt, step0, out
+
+@cc.export("run", RUN_SIGNATURE)
+def run(s, env, reg, nut, M, C, b, decay, target, noise,
+        noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out):
+    agent._run(s, env, reg, nut, M, C, b, decay, target, noise,
+               noise_std, comfort_T, env_step, dispersion_noise, dt, step0, out)
+
+SOURCE_HASH = agent.source_hash()  # frozen into the extension as a constant
+
+@cc.export("source_hash", "i8()")
+def source_hash():
+    return SOURCE_HASH
+
+if __name__ == "__main__":
+    cc.compile()
@@ -1,13 +1,21 @@
 # cfss_gui.py
-import json, os, sys, subprocess, threading, queue, glob, csv
+import json, os, sys, threading, queue, locale
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import importlib.util
+from functools import lru_cache
+from itertools import islice
 
 SECTIONS = ["internal_state", "environment", "regulation", "nutrition"]
 WEIGHTS_KEY = ("params", "weights")
 FLOAT_OPEN_RANGE_KEYS = {("environment", "temperature")}
+WEIGHT_COLUMNS = ("env", "int", "reg", "nut", "decay")
+PREVIEW_ROWS = 200
+PREVIEW_DEBOUNCE_MS = 80
+PREVIEW_CELL_CHARS = 200
+OUTPUT_READ_SIZE = 1 << 16
+OUTPUT_POLL_MS = 50
+CONSOLE_MAX_LINES = 5000
 
 def app_dir():
     return os.path.dirname(os.path.abspath(__file__))
@@ -17,30 +25,51 @@ def default_config_path():
 
 def import_agent_module():
     path = os.path.join(app_dir(), "agent.py")
+    return _exec_agent_module(path, os.stat(path).st_mtime_ns)
+
+@lru_cache(maxsize=1)
+def _exec_agent_module(path, mtime_ns):
+    # mtime_ns is only part of the cache key: an edited agent.py is re-executed
+    import importlib.util
     spec = importlib.util.spec_from_file_location("agent", path)
     mod = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(mod)
     return mod
 
+def _decode_output(data, encoding):
+    # what text=True did: locale decoding plus universal newlines
+    return data.decode(encoding, errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+def _disk_key(path):
+    # identifies one version of a file on disk; None if it does not exist
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
 def merge_defaults(base, defaults):
-    if not isinstance(defaults, dict):
+    if not isinstance(base, dict):
+        if isinstance(defaults, dict):
+            return defaults  # read-through: callers never mutate the result in place
         return base if base is not None else defaults
-    out = dict(defaults)
-    if isinstance(base, dict):
-        for k, v in base.items():
+    # walk base with an explicit stack; every dict level of base gets a fresh dict,
+    # subtrees only present in defaults are shared
+    root = {}
+    stack = [(root, base, defaults)]
+    while stack:
+        out, b, d = stack.pop()
+        if isinstance(d, dict):
+            out.update(d)
+        else:
+            d = {}
+        for k, v in b.items():
             if isinstance(v, dict):
-                out[k] = merge_defaults(v, defaults.get(k, {}))
+                sub = out[k] = {}
+                stack.append((sub, v, d.get(k)))
             else:
                 out[k] = v
-    return out
-
-def is_open_range(section, key):
-    return (section, key) in FLOAT_OPEN_RANGE_KEYS
-
-def clamp01(x):
-    try: xf = float(x)
-    except: return 0.0
-    return max(0.0, min(1.0, xf))
+    return root
 
 class CFSSGui(tk.Tk):
     def __init__(self):
@@ -57,15 +86,24 @@ class CFSSGui(tk.Tk):
         self.agent_mod = None
         self.defaults = {}
         self.cfg = {}
+        self._sorted_section_keys = {}  # section -> sorted keys of self.cfg[section]
+        self._sorted_weight_vars = []   # sorted keys of self.cfg["params"]["weights"]
+        self._cfg_cache = {}  # (path, mtime_ns, size) -> parsed user config
         self.entry_vars = {}
         self.weight_vars = {}
+        self._entry_rows = {}   # (section, key) -> (label, entry)
+        self._weight_rows = {}  # varname -> [label, entry per weight key]
         self.run_steps = tk.StringVar(value="200")
         self.run_name  = tk.StringVar(value="Athena")
         self.data_dir  = tk.StringVar(value="data")
         self.log_csv   = tk.BooleanVar(value=True)
+        # (path, mtime_ns, size) of the file self.cfg was read from / written to, if any;
+        # GO skips rewriting the config only while the file still has this key
+        self._cfg_disk_key = None
 
         self.proc = None
         self.output_queue = queue.Queue()
+        self._preview_after = None  # pending debounced preview
 
         # build UI
         self._build_ui()
@@ -157,9 +195,6 @@ class CFSSGui(tk.Tk):
         self.console = tk.Text(console_frame, height=10, wrap="word", bg="black", fg="#00ff66", insertbackground="#00ff66")
         self.console.pack(fill=tk.BOTH, expand=True)
 
-        # drain output
-        self.after(100, self._drain_output_queue)
-
         # ----- Data Viewer layout -----
         self._build_data_viewer()
 
@@ -173,21 +208,20 @@ class CFSSGui(tk.Tk):
         canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         vsb.pack(side=tk.RIGHT, fill=tk.Y)
 
+        self._section_boxes = {}
         for section in SECTIONS:
             box = ttk.LabelFrame(frame, text=section)
             box.pack(fill=tk.X, padx=6, pady=6)
-            grid_row = 0
+            self._section_boxes[section] = box
             self.entry_vars.setdefault(section, {})
-            for key in []:  # populated later
-                pass
-            # will be populated in populate_from_config()
+            # rows are populated in populate_from_config()
 
         self.left_inner_frame = frame  # for later repopulation
 
     def _build_middle_col(self):
         header = ttk.Frame(self.middle_col)
         header.pack(fill=tk.X, padx=6, pady=(6,0))
-        for i, c in enumerate(["variable","env","int","reg","nut","decay"]):
+        for i, c in enumerate(("variable",) + WEIGHT_COLUMNS):
             ttk.Label(header, text=c, width=12 if i==0 else 8).grid(row=0, column=i, sticky="w", padx=4)
 
         canvas = tk.Canvas(self.middle_col, highlightthickness=0, bg="black")
@@ -239,7 +273,7 @@ class CFSSGui(tk.Tk):
         ttk.Label(left, text="CSV files").pack(anchor="w")
         self.csv_list = tk.Listbox(left, width=40, height=25, bg="black", fg="#00ff66", selectbackground="#004400")
         self.csv_list.pack(fill=tk.Y, expand=False)
-        self.csv_list.bind("<<ListboxSelect>>", lambda e: self.preview_selected_csv())
+        self.csv_list.bind("<<ListboxSelect>>", lambda e: self._schedule_preview())
 
         ctrl = ttk.Frame(left); ctrl.pack(fill=tk.X, pady=6)
         ttk.Button(ctrl, text="Refresh", command=self.refresh_data_list).pack(side=tk.LEFT, padx=(0,6))
@@ -258,7 +292,7 @@ class CFSSGui(tk.Tk):
             self.agent_mod = import_agent_module()
             self.defaults = dict(self.agent_mod.DEFAULT_CONFIG)
         except Exception as e:
-            messagebox.showwarning("Defaults", f"Could not import agent.py defaults.\n{e}")
+            self.warn("Defaults", f"Could not import agent.py defaults; using built-in ones.\n{e}")
             self.defaults = {
                 "run": {"steps": 200, "agent_name": "Athena", "data_dir": "data", "log_csv": True},
                 "internal_state": {"pain":0.2,"instability":0.4,"need_for_control":0.5,"cognitive_load":0.4,"neurochem_balance":0.6,"fatigue":0.3},
@@ -277,46 +311,83 @@ class CFSSGui(tk.Tk):
 
     def _load_cfg(self, path):
         user_cfg = {}
-        if os.path.exists(path):
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    user_cfg = json.load(f)
-            except Exception as e:
-                messagebox.showwarning("Config", f"Failed to parse {path}.\n{e}")
-        self.cfg = merge_defaults(user_cfg, self.defaults)
+        self._cfg_disk_key = None
+        key = _disk_key(path)
+        if key is not None:
+            user_cfg = self._cfg_cache.get(key)
+            if user_cfg is None:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        user_cfg = json.load(f)
+                    self._cfg_cache = {key: user_cfg}
+                except Exception as e:
+                    self.warn("Config", f"Failed to parse {path}; using defaults.\n{e}")
+                    user_cfg = {}
+            if key in self._cfg_cache:
+                self._cfg_disk_key = key
+        # merge_defaults builds fresh dicts for every level of user_cfg, so the
+        # cached copy never leaks into self.cfg
+        self._set_cfg(merge_defaults(user_cfg, self.defaults))
+
+    def _set_cfg(self, cfg):
+        # sort the key orderings once per config rather than on every populate
+        self.cfg = cfg
+        self._sorted_section_keys = {s: sorted(cfg.get(s, {}).keys()) for s in SECTIONS}
+        self._sorted_weight_vars = sorted(cfg.get("params", {}).get("weights", {}).keys())
 
     # ---------- populate ----------
     def populate_from_config(self):
-        # Left column dynamic rebuild
-        for child in self.left_inner_frame.winfo_children():
-            child.destroy()
-        self.entry_vars.clear()
+        # Left column: keep rows whose key is still present, only build/destroy the difference
         for section in SECTIONS:
-            box = ttk.LabelFrame(self.left_inner_frame, text=section)
-            box.pack(fill=tk.X, padx=6, pady=6)
-            grid_row = 0
-            self.entry_vars.setdefault(section, {})
-            for key in sorted(self.cfg.get(section, {}).keys()):
-                sv = tk.StringVar(value=str(self.cfg[section][key]))
-                self.entry_vars[section][key] = sv
-                ttk.Label(box, text=key).grid(row=grid_row, column=0, sticky="w", padx=4, pady=2)
-                e = ttk.Entry(box, textvariable=sv, width=12)
-                e.grid(row=grid_row, column=1, sticky="w", padx=4, pady=2)
-                grid_row += 1
-
-        # Middle weights grid
-        for child in self.weights_frame.winfo_children():
-            child.destroy()
-        self.weight_vars.clear()
+            box = self._section_boxes[section]
+            values = self.cfg.get(section, {})
+            svs = self.entry_vars.setdefault(section, {})
+            keys = self._sorted_section_keys[section]
+            for key in set(svs) - set(values):
+                for w in self._entry_rows.pop((section, key)):
+                    w.destroy()
+                del svs[key]
+            added = False
+            for key in keys:
+                if key in svs:
+                    svs[key].set(str(values[key]))
+                else:
+                    sv = svs[key] = tk.StringVar(value=str(values[key]))
+                    self._entry_rows[(section, key)] = (ttk.Label(box, text=key),
+                                                        ttk.Entry(box, textvariable=sv, width=12))
+                    added = True
+            if added:  # new rows can land anywhere in the sorted order
+                for grid_row, key in enumerate(keys):
+                    label, e = self._entry_rows[(section, key)]
+                    label.grid(row=grid_row, column=0, sticky="w", padx=4, pady=2)
+                    e.grid(row=grid_row, column=1, sticky="w", padx=4, pady=2)
+
+        # Middle weights grid, same reuse
         weights = self.cfg.get("params", {}).get("weights", {})
-        row = 0
-        for varname in sorted(weights.keys()):
-            ttk.Label(self.weights_frame, text=varname, width=12).grid(row=row, column=0, sticky="w", padx=4, pady=2)
-            for j, wkey in enumerate(["env","int","reg","nut","decay"], start=1):
-                sv = tk.StringVar(value=str(weights[varname].get(wkey, 0.0)))
+        varnames = self._sorted_weight_vars
+        for varname in set(self._weight_rows) - set(weights):
+            for w in self._weight_rows.pop(varname):
+                w.destroy()
+            for wkey in WEIGHT_COLUMNS:
+                del self.weight_vars[(varname, wkey)]
+        added = False
+        for varname in varnames:
+            w = weights[varname]
+            if varname in self._weight_rows:
+                for wkey in WEIGHT_COLUMNS:
+                    self.weight_vars[(varname, wkey)].set(str(w.get(wkey, 0.0)))
+                continue
+            widgets = [ttk.Label(self.weights_frame, text=varname, width=12)]
+            for wkey in WEIGHT_COLUMNS:
+                sv = tk.StringVar(value=str(w.get(wkey, 0.0)))
                 self.weight_vars[(varname, wkey)] = sv
-                ttk.Entry(self.weights_frame, textvariable=sv, width=8).grid(row=row, column=j, sticky="w", padx=4, pady=2)
-            row += 1
+                widgets.append(ttk.Entry(self.weights_frame, textvariable=sv, width=8))
+            self._weight_rows[varname] = widgets
+            added = True
+        if added:
+            for row, varname in enumerate(varnames):
+                for j, widget in enumerate(self._weight_rows[varname]):
+                    widget.grid(row=row, column=j, sticky="w", padx=4, pady=2)
 
         # Right run options
         run = self.cfg.get("run", {})
@@ -327,21 +398,20 @@ class CFSSGui(tk.Tk):
 
     # ---------- collect ----------
     def collect_to_config(self):
-        cfg = {"run": {}, "params": {"weights": {}}}
+        # start from the loaded run/params so keys without a widget (run.seed,
+        # run.history_dtype, params.noise_std/targets/env_update) survive a save
+        cfg = {"run": dict(self.cfg.get("run", {})), "params": dict(self.cfg.get("params", {}))}
         # left sections
         for section, sub in self.entry_vars.items():
-            cfg[section] = {}
+            out = cfg[section] = {}
             for key, sv in sub.items():
                 raw = sv.get().strip()
-                if raw == "": continue
+                if not raw: continue
                 try: val = float(raw)
-                except: val = 0.0
-                if not is_open_range(section, key):
-                    val = clamp01(val)
-                cfg[section][key] = val
-
-        # noise_std keep existing default unless we expose UI for it
-        cfg["params"]["noise_std"] = float(self.cfg.get("params", {}).get("noise_std", 0.01))
+                except ValueError: val = 0.0
+                if (section, key) not in FLOAT_OPEN_RANGE_KEYS:
+                    val = max(0.0, min(1.0, val))
+                out[key] = val
 
         # weights
         weights = {}
@@ -349,7 +419,7 @@ class CFSSGui(tk.Tk):
             weights.setdefault(varname, {})
             try:
                 weights[varname][wkey] = float(sv.get().strip())
-            except:
+            except ValueError:
                 weights[varname][wkey] = 0.0
         cfg["params"]["weights"] = weights
 
@@ -384,12 +454,24 @@ class CFSSGui(tk.Tk):
         self.log(f"Loaded: {path}\n")
 
     def save_config_btn(self):
-        cfg = self.collect_to_config()
+        self._write_config(self.collect_to_config())
+
+    def _write_config(self, cfg):
         path = self.config_path.get() or default_config_path()
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(cfg, f, indent=2)
-            self.cfg = cfg
+            # serialize once, write a sibling temp file, then swap it in atomically
+            data = json.dumps(cfg, indent=2)
+            tmp = path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                try: os.remove(tmp)
+                except OSError: pass
+                raise
+            self._set_cfg(cfg)
+            self._cfg_disk_key = _disk_key(path)
             self.log(f"Saved config to {path}\n")
         except Exception as e:
             messagebox.showerror("Save Error", str(e))
@@ -400,9 +482,16 @@ class CFSSGui(tk.Tk):
 
     # ---------- run ----------
     def run_simulation(self):
-        # Save current UI -> config file
-        self.save_config_btn()
+        import subprocess
+        # Save current UI -> config file. The form is always collected (and clamped);
+        # the write is skipped only when that matches self.cfg and the file is still
+        # the one self.cfg was read from / written to, so agent.py never runs with
+        # an edit made outside the GUI
         cfg_path = self.config_path.get() or default_config_path()
+        cfg = self.collect_to_config()
+        if (cfg != self.cfg or self._cfg_disk_key is None
+                or _disk_key(cfg_path) != self._cfg_disk_key):
+            self._write_config(cfg)
         exe = sys.executable or "py"
         agent_py = os.path.join(app_dir(), "agent.py")
         if not os.path.exists(agent_py):
@@ -421,45 +510,90 @@ class CFSSGui(tk.Tk):
                 proc = subprocess.Popen(
                     cmd, cwd=app_dir(),
                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                    text=True, bufsize=1
+                    bufsize=0
                 )
                 self.proc = proc
-                for line in proc.stdout:
-                    self.output_queue.put(line)
+                # read whatever the pipe has (up to 64 KiB) and post only complete
+                # lines, one queue item per read rather than per line
+                encoding = locale.getpreferredencoding(False)
+                fd = proc.stdout.fileno()
+                pending = b""
+                while True:
+                    data = os.read(fd, OUTPUT_READ_SIZE)
+                    if not data:
+                        break
+                    lines, nl, pending = (pending + data).rpartition(b"\n")
+                    if nl:
+                        self._post_output(_decode_output(lines + nl, encoding))
+                if pending:
+                    self._post_output(_decode_output(pending, encoding))
+                proc.stdout.close()
                 rc = proc.wait()
-                self.output_queue.put(f"\n[Process exited {rc}]\n")
+                self._post_output(f"\n[Process exited {rc}]\n")
             except Exception as e:
-                self.output_queue.put(f"\n[ERROR] {e}\n")
+                self._post_output(f"\n[ERROR] {e}\n")
             finally:
                 self.proc = None
-                self.run_btn.config(state="normal")
-                # refresh data list after run
-                self.refresh_data_list()
+                self.output_queue.put(None)  # run finished; see _poll_output
 
         threading.Thread(target=worker, daemon=True).start()
+        self.after(OUTPUT_POLL_MS, self._poll_output)
 
     # ---------- console ----------
     def log(self, text):
         self.console.insert(tk.END, text)
+        # keep only the last CONSOLE_MAX_LINES so inserts don't slow down as it grows
+        lines = int(self.console.index("end-1c").split(".")[0])
+        if lines > CONSOLE_MAX_LINES:
+            self.console.delete("1.0", f"{lines - CONSOLE_MAX_LINES + 1}.0")
         self.console.see(tk.END)
 
-    def _drain_output_queue(self):
+    def warn(self, title, text):
+        # non-fatal problems go to the console rather than a modal dialog, which
+        # would spin a nested event loop (and block startup before the first paint)
+        self.log(f"[{title}] {text}\n")
+
+    def _post_output(self, text):
+        # called from the worker thread, which must not touch Tk at all; the main
+        # loop picks the text up in _poll_output
+        self.output_queue.put(text)
+
+    def _poll_output(self):
+        # runs on the main loop only while a simulation is running, so an idle GUI
+        # has no timer; None from the worker marks the end of the run
+        chunks, done = [], False
         try:
             while True:
-                line = self.output_queue.get_nowait()
-                self.log(line)
+                item = self.output_queue.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                chunks.append(item)
         except queue.Empty:
             pass
-        self.after(100, self._drain_output_queue)
+        if chunks:
+            self.log("".join(chunks))  # one Text insert + see per drain
+        if done:
+            self.run_btn.config(state="normal")
+            self.refresh_data_list()
+        else:
+            self.after(OUTPUT_POLL_MS, self._poll_output)
 
     # ---------- data viewer ----------
     def refresh_data_list(self):
         self.csv_list.delete(0, tk.END)
         d = self.data_dir.get().strip() or "data"
-        pattern = os.path.join(d, "*.csv")
-        files = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
-        for f in files:
-            self.csv_list.insert(tk.END, os.path.basename(f))
+        # one scandir pass gives names and mtimes; newest first
+        try:
+            with os.scandir(d) as it:
+                files = [(e.stat().st_mtime, e.name) for e in it
+                         if e.name.endswith(".csv") and not e.name.startswith(".")
+                         and e.is_file()]
+        except OSError:
+            files = []
+        files.sort(reverse=True)
+        for _, name in files:
+            self.csv_list.insert(tk.END, name)
         if files:
             self.csv_list.selection_clear(0, tk.END)
             self.csv_list.selection_set(0)
@@ -475,6 +609,7 @@ class CFSSGui(tk.Tk):
     def open_selected_csv(self):
         path = self.selected_csv_path()
         if not path: return
+        import subprocess
         try:
             if sys.platform.startswith("win"):
                 os.startfile(path)  # default app
@@ -485,37 +620,47 @@ class CFSSGui(tk.Tk):
         except Exception as e:
             messagebox.showerror("Open", str(e))
 
+    def _schedule_preview(self):
+        # coalesce bursts of selection events (held arrow keys) into one preview
+        if self._preview_after is not None:
+            self.after_cancel(self._preview_after)
+        self._preview_after = self.after(PREVIEW_DEBOUNCE_MS, self._run_scheduled_preview)
+
+    def _run_scheduled_preview(self):
+        self._preview_after = None
+        self.preview_selected_csv()
+
     def preview_selected_csv(self):
         path = self.selected_csv_path()
         if not path or not os.path.exists(path):
             return
-        # clear preview
-        for c in self.preview.get_children():
-            self.preview.delete(c)
-        for col in self.preview["columns"]:
-            self.preview.heading(col, text="")
-        self.preview["columns"] = ()
+        # clear preview (one Tcl call for all rows)
+        self.preview.delete(*self.preview.get_children())
 
         # read first N rows
-        rows = []
-        with open(path, "r", encoding="utf-8") as f:
+        import csv
+        with open(path, "r", encoding="utf-8", newline="") as f:
             rdr = csv.reader(f)
             try:
                 header = next(rdr)
             except StopIteration:
+                self.preview["columns"] = ()
                 return
-            for i, row in enumerate(rdr):
-                rows.append(row)
-                if i >= 200: break
+            # clip long cells before they are marshalled into Tk; columns are only 120px
+            n = PREVIEW_CELL_CHARS
+            rows = [tuple(c if len(c) <= n else c[:n - 3] + "..." for c in row)
+                    for row in islice(rdr, PREVIEW_ROWS)]
 
-        # set columns
+        # set columns; assigning the new column list drops the old headings
         self.preview["columns"] = header
+        heading, column = self.preview.heading, self.preview.column
         for h in header:
-            self.preview.heading(h, text=h)
-            self.preview.column(h, width=120, anchor="w")
+            heading(h, text=h)
+            column(h, width=120, anchor="w")
 
+        insert = self.preview.insert
         for row in rows:
-            self.preview.insert("", "end", values=row)
+            insert("", "end", values=row)
 
 if __name__ == "__main__":
     app = CFSSGui()